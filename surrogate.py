@@ -1,8 +1,19 @@
 import sys
 from functools import wraps
+from itertools import islice
+from types import ModuleType
+
+try:
+    from sys import intern
+except ImportError:
+    # Python 2 has intern() as a builtin
+    pass
 
 __all__ = ('surrogate', )
 
+# marks attributes that were absent before we patched them
+_MISSING = object()
+
 
 class surrogate(object):
     """
@@ -23,15 +34,34 @@ class surrogate(object):
             from sys.my.cool import module2
     """
 
+    __slots__ = ('path', 'elements', '_entered', 'modules',
+                 'known_path', 'base_module', '_saved_all', '_saved_attr',
+                 '_import_paths', '_known_count', '_has_elements',
+                 '_stub_states', '_built', '_installed')
+
     def __init__(self, path):
         self.path = path
-        self.elements = self.path.split('.')
+        self.elements = tuple(self.path.split('.'))
+        self._entered = []
+        self.modules = None
+        self.known_path = None
+        self.base_module = None
+        self._saved_all = _MISSING
+        self._saved_attr = _MISSING
+        self._import_paths = None
+        self._known_count = None
+        self._has_elements = None
+        self._stub_states = None
+        self._built = False
+        self._installed = False
 
     def __enter__(self):
-        self.prepared = self.prepare()
+        # one entry per nested `with`, only the
+        # outermost one has actually prepared stubs
+        self._entered.append(self.prepare())
 
     def __exit__(self, *args):
-        if self.prepared:
+        if self._entered.pop():
             self.restore()
 
     def __call__(self, func):
@@ -44,40 +74,76 @@ class surrogate(object):
             return result
         return _wrapper
 
-    @property
-    def nothing_to_stub(self):
-        """Check if there are no modules to stub"""
-        return len(self.elements) == 0
-
     def prepare(self):
         """Preparations before actual function call"""
-        self._determine_existing_modules()
-        if self.nothing_to_stub:
+        if self._installed:
+            # re-entered while our stubs are in place
             return False
-        self._create_module_stubs()
-        self._save_base_module()
-        self._add_module_stubs()
+        if not self._built or self._existing_modules_changed():
+            self._build()
+        if not self._has_elements:
+            return False
+        self._install()
         return True
 
     def restore(self):
         """Post-actions to restore initial state of the system"""
+        if not self._installed:
+            # nothing was stubbed (or prepare() was never called)
+            return
+        self._uninstall()
+
+    def _build(self):
+        """
+            Create module stubs for the path.
+
+            Stubs are built once and reused by every
+            subsequent prepare() as long as the set
+            of existing modules stays the same.
+        """
+        self._determine_existing_modules()
+        self.base_module = sys.modules.get(self.known_path)
+        self._has_elements = self._known_count < len(self.elements)
+        if self._has_elements:
+            self._determine_import_paths()
+            self._create_module_stubs()
+        self._built = True
+
+    def _existing_modules_changed(self):
+        """
+            Check if modules from our path were
+            imported or removed since stubs were built
+        """
+        modules = sys.modules
+        if modules.get(self.known_path) is not self.base_module:
+            return True
+        if not self._has_elements:
+            return False
+        first_module = modules.get(self._import_paths[0])
+        return first_module is not None and first_module is not self.modules[0]
+
+    def _install(self):
+        """Put previously built stubs in place"""
+        self._save_base_module()
+        self._add_module_stubs()
+        self._installed = True
+
+    def _uninstall(self):
+        """Take stubs away and restore the base module"""
         self._remove_module_stubs()
+        self._reset_module_stubs()
         self._restore_base_module()
-
-    def _get_importing_path(self, elements):
-        """Return importing path for a module that is last in elements list"""
-        ip = '.'.join(elements)
-        if self.known_path:
-            ip = self.known_path + '.' + ip
-        return ip
+        self._installed = False
 
     def _create_module_stubs(self):
         """Create stubs for all not-existing modules"""
         # last module in our sequence
         # it should be loaded
-        last_module = type(self.elements[-1], (object, ), {
-            '__all__': [],
-            '_importing_path': self._get_importing_path(self.elements)})
+        paths = self._import_paths
+        last_module = ModuleType(self.elements[-1])
+        last_module.__all__ = []
+        last_module.__path__ = []
+        last_module._importing_path = paths[-1]
         modules = [last_module]
 
         # now we create a module stub for each
@@ -85,15 +151,25 @@ class surrogate(object):
         # each module stub contains `__all__`
         # list and a member that
         # points to the next module stub in
-        # sequence
-        for element in reversed(self.elements[:-1]):
+        # sequence. every stub is a package
+        # (has `__path__`) so that its children
+        # can be imported
+        elements = self.elements
+        known = self._known_count
+        for i in range(len(elements) - 2, known - 1, -1):
             next_module = modules[-1]
-            module = type(element, (object, ), {
-                next_module.__name__: next_module,
-                '__all__': [next_module.__name__]})
+            module = ModuleType(elements[i])
+            setattr(module, next_module.__name__, next_module)
+            module.__all__ = [next_module.__name__]
+            module.__path__ = []
+            module._importing_path = paths[i - known]
             modules.append(module)
-        self.modules = list(reversed(modules))
-        self.modules[0].__path__ = []
+        modules.reverse()
+        self.modules = modules
+        # remember the built state of every stub
+        # so that it can be reset after each use
+        self._stub_states = [
+            self._copy_stub_state(module.__dict__) for module in modules]
 
     def _determine_existing_modules(self):
         """
@@ -103,12 +179,39 @@ class surrogate(object):
             those modules should not be replaced
             by stubs.
         """
+        modules = sys.modules
+        elements = self.elements
         known = 0
-        while known < len(self.elements) and\
-                    '.'.join(self.elements[:known + 1]) in sys.modules:
+        known_path = ''
+        prefix = elements[0]
+        # extend the prefix one element at a time instead
+        # of re-joining the whole head of the path
+        while known < len(elements) and prefix in modules:
+            known_path = prefix
             known += 1
-        self.known_path = '.'.join(self.elements[:known])
-        self.elements = self.elements[known:]
+            if known < len(elements):
+                prefix = prefix + '.' + elements[known]
+        self.known_path = known_path
+        self._known_count = known
+
+    def _determine_import_paths(self):
+        """
+            Compute importing path of every module
+            that is going to be stubbed.
+            Each path extends the previous one, so
+            they are built in a single pass.
+        """
+        paths = []
+        acc = self.known_path
+        for element in islice(self.elements, self._known_count, None):
+            acc = (acc + '.' + element) if acc else element
+            # interned paths are shared with every later
+            # lookup of the same key in sys.modules;
+            # Python 2 can intern byte strings only
+            if type(acc) is str:
+                acc = intern(acc)
+            paths.append(acc)
+        self._import_paths = paths
 
     def _save_base_module(self):
         """
@@ -119,41 +222,64 @@ class surrogate(object):
             remember it's state in order to restore it
             afterwards.
         """
-
-        try:
-            # save last of the existing modules
-            self.base_module = sys.modules[self.known_path]
-        except KeyError:
-            self.base_module = None
+        if self.base_module is None:
+            return
+        first_module = self.modules[0]
+        first_name = first_module.__name__
 
         # save `__all__` attribute of the base_module
-        self.base_all = []
-        if hasattr(self.base_module, '__all__'):
-            self.base_all = list(self.base_module.__all__)
-        if self.base_module:
-            # change base_module's `__all__` attribute
-            # to include the first module of the sequence
-            self.base_module.__all__ = self.base_all + [self.elements[0]]
-            setattr(self.base_module, self.elements[0], self.modules[0])
+        # and the attribute we are going to replace;
+        # both are restored as they were
+        self._saved_all = getattr(self.base_module, '__all__', _MISSING)
+        self._saved_attr = getattr(self.base_module, first_name, _MISSING)
+        # change base_module's `__all__` attribute
+        # to include the first module of the sequence
+        if self._saved_all is _MISSING:
+            self.base_module.__all__ = [first_name]
+        else:
+            self.base_module.__all__ = list(self._saved_all) + [first_name]
+        setattr(self.base_module, first_name, first_module)
 
     def _add_module_stubs(self):
         """Push created module stubs into sys.modules"""
-        for i, module in enumerate(self.modules):
-            module._importing_path =\
-                self._get_importing_path(self.elements[:i + 1])
-            sys.modules[module._importing_path] = module
+        sys.modules.update(zip(self._import_paths, self.modules))
 
     def _remove_module_stubs(self):
         """Remove fake modules from sys.modules"""
+        pop = sys.modules.pop
         for module in reversed(self.modules):
-            if module._importing_path in sys.modules:
-                del sys.modules[module._importing_path]
+            pop(module._importing_path, None)
+
+    @staticmethod
+    def _copy_stub_state(namespace):
+        """Copy stub's namespace without sharing its mutable lists"""
+        state = dict(namespace)
+        state['__all__'] = list(namespace['__all__'])
+        state['__path__'] = list(namespace['__path__'])
+        return state
+
+    def _reset_module_stubs(self):
+        """Drop everything that was set on stubs while they were in use"""
+        for module, state in zip(self.modules, self._stub_states):
+            module.__dict__.clear()
+            module.__dict__.update(self._copy_stub_state(state))
 
     def _restore_base_module(self):
         """Restore the state of the last existing module"""
-        if self.base_module:
-            self.base_module.__all__ = self.base_all
-            if not self.base_all:
+        if self.base_module is None:
+            return
+        if self._saved_all is _MISSING:
+            try:
                 del self.base_module.__all__
-            if hasattr(self.base_module, self.elements[0]):
-                delattr(self.base_module, self.elements[0])
+            except AttributeError:
+                pass
+        else:
+            self.base_module.__all__ = self._saved_all
+        first_name = self.modules[0].__name__
+        if self._saved_attr is _MISSING:
+            try:
+                delattr(self.base_module, first_name)
+            except AttributeError:
+                pass
+        else:
+            setattr(self.base_module, first_name, self._saved_attr)
@@ -1,4 +1,6 @@
+import sys
 import unittest
+from types import ModuleType
 from surrogate import surrogate
 
 def imports():
@@ -27,6 +29,151 @@ class TestSurrogateModuleStubs(unittest.TestCase):
         with self.assertRaises(ImportError) as e:
             imports()
 
+    def test_repeated_calls(self):
+        @surrogate('my')
+        @surrogate('my.module.one')
+        @surrogate('my.module.two')
+        def stubbed():
+            imports()
+
+        for _ in range(3):
+            stubbed()
+
+        with self.assertRaises(ImportError) as e:
+            imports()
+
+    def test_repeated_calls_get_clean_stubs(self):
+        @surrogate('leak.mod')
+        def stubbed():
+            import leak
+            import leak.mod
+            value = getattr(leak.mod, 'value', None)
+            names = list(leak.__all__)
+            leak.mod.value = 42
+            leak.__all__.append('extra')
+            leak.__path__.append('extra')
+            return value, names, leak.__path__
+
+        self.assertEqual(stubbed(), (None, ['mod'], ['extra']))
+        self.assertEqual(stubbed(), (None, ['mod'], ['extra']))
+
+    def test_rebuild_when_base_module_changes(self):
+        @surrogate('base.stub')
+        def stubbed():
+            import base.stub
+            return base
+
+        first = ModuleType('base')
+        sys.modules['base'] = first
+        try:
+            self.assertIs(stubbed(), first)
+            second = ModuleType('base')
+            sys.modules['base'] = second
+            self.assertIs(stubbed(), second)
+            self.assertFalse(hasattr(first, 'stub'))
+        finally:
+            del sys.modules['base']
+        self.assertIsNot(stubbed(), second)
+        self.assertNotIn('base', sys.modules)
+
+    def test_rebuild_when_stubbed_module_is_imported(self):
+        @surrogate('real.stub')
+        def stubbed():
+            import real.stub
+            return real
+
+        stub = stubbed()
+        real = ModuleType('real')
+        sys.modules['real'] = real
+        try:
+            self.assertIs(stubbed(), real)
+            self.assertIs(sys.modules['real'], real)
+            self.assertNotIn('real.stub', sys.modules)
+            self.assertFalse(hasattr(real, 'stub'))
+        finally:
+            del sys.modules['real']
+        self.assertIsNot(stub, real)
+
+    def test_same_path_gets_clean_stubs(self):
+        @surrogate('leak.mod')
+        def first():
+            import leak.mod
+            leak.mod.value = 42
+
+        @surrogate('leak.mod')
+        def second():
+            import leak.mod
+            return getattr(leak.mod, 'value', None)
+
+        first()
+        self.assertIsNone(second())
+
+    def test_base_module_is_restored(self):
+        base = ModuleType('base')
+        base.__all__ = ('shadowed', )
+        base.shadowed = 'original'
+        original_all = base.__all__
+        sys.modules['base'] = base
+        try:
+            with surrogate('base.shadowed.stub'):
+                import base.shadowed.stub
+                self.assertEqual(list(base.__all__), ['shadowed', 'shadowed'])
+                self.assertIsNot(base.shadowed, 'original')
+            self.assertIs(base.__all__, original_all)
+            self.assertEqual(base.shadowed, 'original')
+
+            del base.__all__
+            del base.shadowed
+            with surrogate('base.stub'):
+                import base.stub
+            self.assertFalse(hasattr(base, '__all__'))
+            self.assertFalse(hasattr(base, 'stub'))
+        finally:
+            del sys.modules['base']
+
+    def test_decorator_keeps_function_metadata(self):
+        def stubbed():
+            """docstring"""
+        stubbed.pytestmark = ['mark']
+
+        wrapped = surrogate('my')(stubbed)
+        self.assertEqual(wrapped.__name__, 'stubbed')
+        self.assertEqual(wrapped.__doc__, 'docstring')
+        self.assertEqual(wrapped.__module__, stubbed.__module__)
+        self.assertEqual(wrapped.pytestmark, ['mark'])
+
+    def test_restore_without_prepare(self):
+        surrogate('my.module.one').restore()
+        self.assertNotIn('my', sys.modules)
+
+    def test_already_loaded_path(self):
+        real_sys = sys.modules['sys']
+        with surrogate('sys'):
+            import sys as imported
+            self.assertIs(imported, real_sys)
+        self.assertIs(sys.modules['sys'], real_sys)
+
+    def test_recursive_call(self):
+        @surrogate('rec.mod')
+        def stubbed(n):
+            import rec.mod
+            if n:
+                stubbed(n - 1)
+            self.assertIn('rec.mod', sys.modules)
+
+        stubbed(2)
+        self.assertNotIn('rec', sys.modules)
+        self.assertNotIn('rec.mod', sys.modules)
+
+    def test_nested_same_instance(self):
+        stub = surrogate('rec.mod')
+        with stub:
+            with stub:
+                import rec.mod
+            import rec.mod
+        self.assertNotIn('rec', sys.modules)
+        self.assertNotIn('rec.mod', sys.modules)
+
     def test_context_manager(self):
         with surrogate('my'):
             with surrogate('my.module.one'):